@@ -0,0 +1,99 @@
+"""Benchmark recommendation filtering as the number of filters grows.
+
+Tiles styles.csv up to --items rows and times candidate selection through the
+bitset indexes against the equivalent chained pandas boolean masks.
+
+    python bench_filters.py --items 50000 --repeat 200
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from catalog import STRING_COLUMNS, Catalog
+from catalog_index import FILTER_COLUMNS, CatalogIndex
+
+ROOT_DIR = Path(__file__).parent
+
+GENDER = "Men"
+COLORS = ["Blue", "Black", "White", "Navy Blue"]
+# Added one at a time: (query parameter, values)
+FILTERS = [
+    ("season", ["Summer", "Fall"]),
+    ("usage", ["Casual", "Formal"]),
+    ("master_category", ["Apparel", "Footwear"]),
+    ("article_type", ["Shirts", "Jeans", "Casual Shoes", "Track Pants"]),
+    ("year", (2011, 2016)),
+]
+
+
+def tiled_catalog(catalog: Catalog, items: int) -> Catalog:
+    """Repeat the catalog's rows until it holds `items` rows"""
+    reps = -(-items // len(catalog))
+    arrays = dict(catalog.arrays)
+    arrays["id"] = np.arange(items, dtype=np.int64)
+    arrays["year"] = np.tile(catalog.year, reps)[:items]
+    for column in STRING_COLUMNS:
+        arrays[f"{column}.codes"] = np.tile(catalog.codes[column], reps)[:items]
+    return Catalog(arrays)
+
+
+def to_dataframe(catalog: Catalog) -> pd.DataFrame:
+    data = {column: [catalog.value(column, row) for row in range(len(catalog))] for column in STRING_COLUMNS}
+    data["year"] = catalog.year
+    return pd.DataFrame(data)
+
+
+def indexed(index: CatalogIndex, n_filters: int) -> np.ndarray:
+    filters = {name: values for name, values in FILTERS[:n_filters] if name != "year"}
+    year_min, year_max = dict(FILTERS[:n_filters]).get("year", (None, None))
+    return index.candidate_rows(GENDER, COLORS, filters, year_min, year_max)
+
+
+def pandas_masks(df: pd.DataFrame, n_filters: int) -> np.ndarray:
+    mask = df["gender"].str.lower() == GENDER.lower()
+    for name, values in FILTERS[:n_filters]:
+        if name == "year":
+            mask &= df["year"].between(*values)
+        else:
+            mask &= df[FILTER_COLUMNS[name]].isin(values)
+    rows = np.flatnonzero(mask & df["baseColour"].isin(COLORS))
+    if rows.size == 0:
+        rows = np.flatnonzero(mask)
+    return rows
+
+
+def timed(fn, repeat: int) -> float:
+    """Median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return float(np.median(samples)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    catalog = tiled_catalog(Catalog.from_csv(ROOT_DIR / "styles.csv"), args.items)
+    index = CatalogIndex(catalog)
+    df = to_dataframe(catalog)
+
+    print(f"{len(catalog)} items, median of {args.repeat} runs")
+    print(f"{'filters':>7}  {'indexed ms':>10}  {'pandas ms':>9}  {'rows':>6}")
+    for n_filters in range(len(FILTERS) + 1):
+        rows = indexed(index, n_filters)
+        assert np.array_equal(rows, pandas_masks(df, n_filters))
+        indexed_ms = timed(lambda: indexed(index, n_filters), args.repeat)
+        pandas_ms = timed(lambda: pandas_masks(df, n_filters), args.repeat)
+        print(f"{n_filters:>7}  {indexed_ms:>10.3f}  {pandas_ms:>9.3f}  {len(rows):>6}")
+
+
+if __name__ == "__main__":
+    main()
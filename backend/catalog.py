@@ -0,0 +1,227 @@
+"""Fashion catalog stored as numeric code arrays plus string tables.
+
+Every text column of styles.csv is dictionary-encoded: each row holds an int32
+code into a per-column string table, and each table is a single UTF-8 blob with
+offsets. Strings are only decoded for the rows a response actually returns.
+
+Because the catalog is nothing but flat numpy arrays it can be published once
+into ``multiprocessing.shared_memory`` by a parent process (see ``serve.py``)
+and attached zero-copy by every uvicorn worker, so adding workers does not add
+copies of the catalog.
+"""
+import json
+import logging
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STRING_COLUMNS = (
+    "gender",
+    "masterCategory",
+    "subCategory",
+    "articleType",
+    "baseColour",
+    "season",
+    "usage",
+    "productDisplayName",
+)
+
+_HEADER_SIZE = 8
+_ALIGNMENT = 64
+
+
+class StringTable:
+    """Immutable list of strings stored as a UTF-8 blob plus offsets"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+        self._index: Optional[Dict[str, int]] = None
+        self._folded_index: Optional[Dict[str, List[int]]] = None
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> "StringTable":
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        data = np.frombuffer(b"".join(encoded), dtype=np.uint8).copy()
+        return cls(data, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, code: int) -> str:
+        start, end = self.offsets[code], self.offsets[code + 1]
+        return self.data[start:end].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return (self[code] for code in range(len(self)))
+
+    def code(self, value: str) -> int:
+        """Code of an exact string, or -1 if it is not in the table"""
+        if self._index is None:
+            self._index = {s: code for code, s in enumerate(self)}
+        return self._index.get(value, -1)
+
+    def codes_folded(self, value: str) -> List[int]:
+        """Codes of every string equal to value ignoring case"""
+        if self._folded_index is None:
+            folded: Dict[str, List[int]] = {}
+            for code, s in enumerate(self):
+                folded.setdefault(s.casefold(), []).append(code)
+            self._folded_index = folded
+        return self._folded_index.get(value.casefold(), [])
+
+
+class Catalog:
+    """Column-oriented, dictionary-encoded view of styles.csv"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], shm: Optional[shared_memory.SharedMemory] = None):
+        self.arrays = arrays
+        # Keeps an attached segment mapped for as long as the arrays are in use
+        self._shm = shm
+        self._id_order: Optional[np.ndarray] = None
+        self.ids = arrays["id"]
+        self.year = arrays["year"]
+        self.codes = {column: arrays[f"{column}.codes"] for column in STRING_COLUMNS}
+        self.tables = {
+            column: StringTable(arrays[f"{column}.data"], arrays[f"{column}.offsets"])
+            for column in STRING_COLUMNS
+        }
+
+    @classmethod
+    def empty(cls) -> "Catalog":
+        arrays = {"id": np.zeros(0, dtype=np.int64), "year": np.zeros(0, dtype=np.float32)}
+        for column in STRING_COLUMNS:
+            table = StringTable.from_strings([])
+            arrays[f"{column}.codes"] = np.zeros(0, dtype=np.int32)
+            arrays[f"{column}.data"] = table.data
+            arrays[f"{column}.offsets"] = table.offsets
+        return cls(arrays)
+
+    @classmethod
+    def from_csv(cls, path: Path) -> "Catalog":
+        import pandas as pd
+
+        df = pd.read_csv(path, on_bad_lines="skip")
+        arrays = {
+            "id": df["id"].to_numpy(dtype=np.int64),
+            "year": pd.to_numeric(df["year"], errors="coerce").to_numpy(dtype=np.float32),
+        }
+        for column in STRING_COLUMNS:
+            codes, uniques = pd.factorize(df[column].fillna("").astype(str))
+            table = StringTable.from_strings(uniques)
+            arrays[f"{column}.codes"] = codes.astype(np.int32)
+            arrays[f"{column}.data"] = table.data
+            arrays[f"{column}.offsets"] = table.offsets
+        return cls(arrays)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def find_row(self, item_id: int) -> int:
+        """Row of the item with this id, or -1"""
+        if self._id_order is None:
+            self._id_order = np.argsort(self.ids, kind="stable")
+        pos = int(np.searchsorted(self.ids, item_id, sorter=self._id_order))
+        if pos < len(self) and self.ids[self._id_order[pos]] == item_id:
+            return int(self._id_order[pos])
+        return -1
+
+    def value(self, column: str, row: int) -> str:
+        return self.tables[column][self.codes[column][row]]
+
+    def row(self, row: int) -> dict:
+        """Decode a single item into a dict keyed like the styles.csv columns"""
+        item = {column: self.value(column, row) for column in STRING_COLUMNS}
+        item["id"] = int(self.ids[row])
+        item["year"] = None if np.isnan(self.year[row]) else int(self.year[row])
+        return item
+
+    def mask(self, column: str, values: Iterable[str], ignore_case: bool = False) -> np.ndarray:
+        """Boolean mask of rows whose column equals any of values"""
+        table = self.tables[column]
+        if ignore_case:
+            codes = [code for value in values for code in table.codes_folded(value)]
+        else:
+            codes = [code for code in (table.code(value) for value in values) if code >= 0]
+        if not codes:
+            return np.zeros(len(self), dtype=bool)
+        return np.isin(self.codes[column], codes)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def publish(self, name: Optional[str] = None) -> shared_memory.SharedMemory:
+        """Copy the catalog into a new shared memory segment.
+
+        The caller owns the segment and must ``close()`` and ``unlink()`` it
+        once every worker has exited.
+        """
+        layout = {}
+        offset = 0
+        for key, array in self.arrays.items():
+            layout[key] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset += -(-array.nbytes // _ALIGNMENT) * _ALIGNMENT
+        header = json.dumps(layout).encode("utf-8")
+        data_start = -(-(_HEADER_SIZE + len(header)) // _ALIGNMENT) * _ALIGNMENT
+
+        shm = shared_memory.SharedMemory(name=name, create=True, size=max(data_start + offset, 1))
+        shm.buf[:_HEADER_SIZE] = len(header).to_bytes(_HEADER_SIZE, "little")
+        shm.buf[_HEADER_SIZE:_HEADER_SIZE + len(header)] = header
+        for key, array in self.arrays.items():
+            spec = layout[key]
+            target = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=data_start + spec["offset"])
+            target[...] = array
+        _published.add(shm.name)
+        logger.info(f"Published catalog ({len(self)} items, {self.nbytes} bytes) to shared memory '{shm.name}'")
+        return shm
+
+    @classmethod
+    def attach(cls, name: str) -> "Catalog":
+        """Map a catalog published by another process without copying it"""
+        shm = _attach_untracked(name)
+        header_size = int.from_bytes(bytes(shm.buf[:_HEADER_SIZE]), "little")
+        layout = json.loads(bytes(shm.buf[_HEADER_SIZE:_HEADER_SIZE + header_size]).decode("utf-8"))
+        data_start = -(-(_HEADER_SIZE + header_size) // _ALIGNMENT) * _ALIGNMENT
+        arrays = {}
+        for key, spec in layout.items():
+            array = np.ndarray(
+                tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]),
+                buffer=shm.buf, offset=data_start + spec["offset"],
+            )
+            array.flags.writeable = False
+            arrays[key] = array
+        return cls(arrays, shm=shm)
+
+
+# Segments published by this process; attaching to them must leave the
+# publisher's resource tracker registration alone
+_published: Set[str] = set()
+
+
+def _tracker_inherited() -> bool:
+    # A spawned child (e.g. a uvicorn worker under serve.py) is handed its
+    # parent's tracker fd but never launches a tracker itself, so _pid is unset
+    tracker = resource_tracker._resource_tracker
+    return getattr(tracker, "_fd", None) is not None and getattr(tracker, "_pid", None) is None
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    # Attaching registers the segment with this process's resource tracker.
+    # A tracker of our own would unlink it when this worker exits, so drop
+    # that registration; but when the tracker is the publisher's (same process
+    # or inherited through spawn) the registration is the publisher's own and
+    # must stay, both for its unlink() and for cleanup if it dies abruptly.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 has no track argument
+        shm = shared_memory.SharedMemory(name=name)
+        if shm.name not in _published and not _tracker_inherited():
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
@@ -0,0 +1,96 @@
+"""Precomputed bitset indexes over the catalog's filterable columns.
+
+For every value of an indexed column the index keeps a packed bitset (one bit
+per catalog row). A filter on several values ORs their bitsets, filters on
+different columns AND together, and rows are only unpacked once at the end, so
+each extra filter costs a pass over n/8 bytes instead of a full boolean mask
+over the decoded column.
+"""
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+from catalog import Catalog
+
+INDEXED_COLUMNS = ("gender", "masterCategory", "articleType", "baseColour", "season", "usage")
+
+# Query parameter name -> catalog column for the multi-valued filters
+FILTER_COLUMNS = {
+    "season": "season",
+    "usage": "usage",
+    "article_type": "articleType",
+    "master_category": "masterCategory",
+}
+
+
+def _packed_bitsets(codes: np.ndarray, n_values: int) -> np.ndarray:
+    """(n_values, ceil(n/8)) packed bitsets, row i marking rows whose code is i"""
+    matrix = np.zeros((n_values, len(codes)), dtype=bool)
+    matrix[codes, np.arange(len(codes))] = True
+    return np.packbits(matrix, axis=1)
+
+
+class CatalogIndex:
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        self.size = len(catalog)
+        self.nbytes = (self.size + 7) // 8
+        self.bitsets: Dict[str, np.ndarray] = {
+            column: _packed_bitsets(catalog.codes[column], len(catalog.tables[column]))
+            for column in INDEXED_COLUMNS
+        }
+        known = ~np.isnan(catalog.year)
+        self.years = np.unique(catalog.year[known]).astype(np.int32)
+        year_codes = np.searchsorted(self.years, catalog.year[known].astype(np.int32))
+        year_bits = np.zeros((len(self.years), len(catalog)), dtype=bool)
+        year_bits[year_codes, np.flatnonzero(known)] = True
+        self.year_bitsets = np.packbits(year_bits, axis=1)
+
+    def none(self) -> np.ndarray:
+        return np.zeros(self.nbytes, dtype=np.uint8)
+
+    def select(self, column: str, values: Iterable[str], ignore_case: bool = False) -> np.ndarray:
+        """Bitset of rows whose column equals any of values"""
+        table = self.catalog.tables[column]
+        if ignore_case:
+            codes = [code for value in values for code in table.codes_folded(value)]
+        else:
+            codes = [code for code in (table.code(value) for value in values) if code >= 0]
+        if not codes:
+            return self.none()
+        return np.bitwise_or.reduce(self.bitsets[column][codes], axis=0)
+
+    def year_range(self, year_min: Optional[int], year_max: Optional[int]) -> np.ndarray:
+        """Bitset of rows whose year lies in [year_min, year_max]; open ends allowed"""
+        start = 0 if year_min is None else np.searchsorted(self.years, year_min, side="left")
+        end = len(self.years) if year_max is None else np.searchsorted(self.years, year_max, side="right")
+        if start >= end:
+            return self.none()
+        return np.bitwise_or.reduce(self.year_bitsets[start:end], axis=0)
+
+    def rows(self, bits: np.ndarray) -> np.ndarray:
+        return np.flatnonzero(np.unpackbits(bits, count=self.size))
+
+    def candidate_rows(
+        self,
+        gender: str,
+        colors: Iterable[str],
+        filters: Optional[Dict[str, Iterable[str]]] = None,
+        year_min: Optional[int] = None,
+        year_max: Optional[int] = None,
+    ) -> np.ndarray:
+        """Rows matching gender, filters and colours.
+
+        Falls back to ignoring the colours when no item matches them, so a
+        request still gets items for the gender and the requested filters.
+        """
+        bits = self.select("gender", [gender], ignore_case=True)
+        for name, values in (filters or {}).items():
+            if values:
+                bits &= self.select(FILTER_COLUMNS[name], values)
+        if year_min is not None or year_max is not None:
+            bits &= self.year_range(year_min, year_max)
+        rows = self.rows(bits & self.select("baseColour", colors))
+        if rows.size == 0:
+            rows = self.rows(bits)
+        return rows
@@ -0,0 +1,104 @@
+"""LRU cache of filtered recommendation candidates.
+
+Recommendation requests repeat the same gender/colour/filter combinations, so
+the catalog rows that survive filtering are cached as an int32 row array keyed
+by a normalized form of the query. A request then only samples ``limit`` rows
+from the cached array instead of re-scanning the catalog.
+
+Entries are evicted least-recently-used once either ``max_entries`` or
+``max_bytes`` is exceeded; ``clear`` must be called whenever the catalog is
+reloaded, since row numbers refer to a specific catalog.
+"""
+import sys
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Rough per-entry bookkeeping cost (OrderedDict node, ndarray header)
+_ENTRY_OVERHEAD = 256
+
+
+def make_key(gender: str, colors: Iterable[str], filters: Optional[Dict[str, Iterable]] = None) -> Tuple:
+    """Normalize a query so equivalent requests share one cache entry.
+
+    Gender matching ignores case and colour order/duplicates do not change the
+    result, so both are folded away; callers strip whitespace beforehand.
+    Multi-valued filters are sorted; tuple values (ranges) are kept as given.
+    """
+    color_key = tuple(sorted(set(colors)))
+    filter_key = tuple(sorted(
+        (name, tuple(sorted(values)) if not isinstance(values, tuple) else values)
+        for name, values in (filters or {}).items()
+        if values
+    ))
+    return (gender.casefold(), color_key, filter_key)
+
+
+def _key_size(key) -> int:
+    """Deep size of a cache key in bytes.
+
+    ``sys.getsizeof`` only counts a tuple's own slots, not the strings it
+    holds, and keys built from long colour or filter lists can be kilobytes.
+    """
+    size = sys.getsizeof(key)
+    if isinstance(key, (tuple, list, frozenset)):
+        size += sum(_key_size(item) for item in key)
+    return size
+
+
+class RecommendationCache:
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[np.ndarray, int]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, rows: np.ndarray) -> np.ndarray:
+        rows = np.ascontiguousarray(rows, dtype=np.int32)
+        rows.flags.writeable = False
+        size = rows.nbytes + _key_size(key) + _ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return rows
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._entries[key] = (rows, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+        return rows
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
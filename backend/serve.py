@@ -0,0 +1,46 @@
+"""Run the API with several uvicorn workers sharing one copy of the catalog.
+
+The parent process loads styles.csv once, publishes it to shared memory and
+passes the segment name to the workers through CATALOG_SHM_NAME; each worker
+attaches to it zero-copy instead of parsing the CSV itself. The similar items
+feature matrix is also built here and saved to SIMILAR_ITEMS_PATH, so workers
+only load it and never need to import scikit-learn.
+
+    python serve.py --workers 4 --port 8001
+"""
+import argparse
+import os
+from pathlib import Path
+
+import uvicorn
+
+import similar_items
+from catalog import Catalog
+
+ROOT_DIR = Path(__file__).parent
+# Must match the default in server.py
+SIMILAR_ITEMS_PATH = Path(os.environ.get("SIMILAR_ITEMS_PATH", ROOT_DIR / "similar_items.npz"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    catalog = Catalog.from_csv(ROOT_DIR / "styles.csv")
+    if len(catalog) > 0:
+        similar_items.SimilarItemsIndex.load_or_build(catalog, SIMILAR_ITEMS_PATH)
+    shm = catalog.publish()
+    del catalog
+    os.environ["CATALOG_SHM_NAME"] = shm.name
+    try:
+        uvicorn.run("server:app", host=args.host, port=args.port, workers=args.workers, app_dir=str(ROOT_DIR))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+if __name__ == "__main__":
+    main()
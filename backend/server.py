@@ -1,32 +1,78 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Depends
+import time
+_process_started = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, Depends, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
+import json
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import uuid
 from datetime import datetime, timedelta
-import pandas as pd
-import cv2
 import numpy as np
-from sklearn.cluster import KMeans
 import jwt
 from passlib.context import CryptContext
-import io
-from PIL import Image
-import base64
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+import skin_tone
+from catalog import Catalog
+from catalog_index import CatalogIndex
+from recommendation_cache import RecommendationCache, make_key
+from skin_tone import SkinToneError
+from user_profiles import ProfileStore, profile_keys_of
+from write_behind import WriteBehindBuffer
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Startup timings (ms) per phase, logged as each phase completes
+startup_timings = {"imports": round((time.perf_counter() - _process_started) * 1000, 1)}
+logger.info(f"Startup phase 'imports' took {startup_timings['imports']} ms")
+
+@contextmanager
+def startup_phase(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"Startup phase '{name}' took {startup_timings[name]} ms")
+
+with startup_phase("config"):
+    ROOT_DIR = Path(__file__).parent
+    load_dotenv(ROOT_DIR / '.env')
+
+    # MongoDB connection
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+# Skin tone analyses are history only, so they are written behind the response
+analysis_writer = WriteBehindBuffer(
+    db.skin_tone_analyses,
+    max_batch=int(os.environ.get('ANALYSIS_BATCH_SIZE', '100')),
+    flush_interval=float(os.environ.get('ANALYSIS_FLUSH_SECONDS', '1.0')),
+)
+
+# Favorites-based preference profiles, cached in-process for the hot path
+profile_store = ProfileStore(
+    db,
+    max_entries=int(os.environ.get('PROFILE_CACHE_ENTRIES', '10000')),
+    ttl=float(os.environ.get('PROFILE_CACHE_TTL_SECONDS', '300')),
+)
 
 # Security
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-here')
@@ -35,6 +81,17 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
+
+# Skin tone pipeline. With SKIN_TONE_WORKERS > 0 analyses run in a separate
+# process pool and this process never imports OpenCV; otherwise the pipeline is
+# loaded in-process, either by a background warm-up task or on first use.
+SKIN_TONE_WORKERS = int(os.environ.get('SKIN_TONE_WORKERS', '0'))
+SKIN_TONE_WARMUP = os.environ.get('SKIN_TONE_WARMUP', 'true').lower() == 'true'
+skin_tone_pool: Optional[ProcessPoolExecutor] = None
+# Messages (frames, including rejected ones) after which a skin tone stream
+# returns its best estimate unconverged
+SKIN_TONE_STREAM_MAX_FRAMES = int(os.environ.get('SKIN_TONE_STREAM_MAX_FRAMES', '150'))
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -42,13 +99,57 @@ app = FastAPI()
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
-# Load fashion dataset
-try:
-    styles_df = pd.read_csv(ROOT_DIR / "styles.csv")
-    print(f"✅ Loaded {len(styles_df)} fashion items")
-except Exception as e:
-    print(f"⚠️ Could not load styles.csv: {e}")
-    styles_df = pd.DataFrame()
+# Filtered candidate rows per normalized query; tied to the loaded catalog
+candidate_cache = RecommendationCache(
+    max_entries=int(os.environ.get('RECOMMENDATION_CACHE_ENTRIES', '1024')),
+    max_bytes=int(os.environ.get('RECOMMENDATION_CACHE_BYTES', str(64 * 1024 * 1024))),
+)
+
+# Load fashion dataset. When launched through serve.py the parent process has
+# already published the catalog to shared memory and workers attach to it.
+CATALOG_SHM_NAME = os.environ.get('CATALOG_SHM_NAME')
+
+def load_catalog() -> Catalog:
+    """(Re)load the catalog, rebuild its filter indexes and drop cached candidates"""
+    global catalog, catalog_index
+    try:
+        if CATALOG_SHM_NAME:
+            catalog = Catalog.attach(CATALOG_SHM_NAME)
+            print(f"✅ Attached {len(catalog)} fashion items from shared memory '{CATALOG_SHM_NAME}'")
+        else:
+            catalog = Catalog.from_csv(ROOT_DIR / "styles.csv")
+            print(f"✅ Loaded {len(catalog)} fashion items")
+    except Exception as e:
+        print(f"⚠️ Could not load styles.csv: {e}")
+        catalog = Catalog.empty()
+    catalog_index = CatalogIndex(catalog)
+    candidate_cache.clear()
+    return catalog
+
+with startup_phase("catalog"):
+    load_catalog()
+
+rng = np.random.default_rng()
+
+# Item-to-item similarity. similar_items pulls in scipy (and scikit-learn when
+# the feature matrix has to be built rather than loaded from SIMILAR_ITEMS_PATH),
+# so it is imported by a background task or on first use.
+SIMILAR_ITEMS_PATH = Path(os.environ.get('SIMILAR_ITEMS_PATH', ROOT_DIR / 'similar_items.npz'))
+SIMILAR_ITEMS_WARMUP = os.environ.get('SIMILAR_ITEMS_WARMUP', 'true').lower() == 'true'
+_similar_items = None
+
+def load_similar_items_index():
+    """Import similar_items and load or build the index for the current catalog"""
+    global _similar_items
+    import similar_items
+    _similar_items = similar_items
+    return similar_items.get_index(catalog, SIMILAR_ITEMS_PATH)
+
+def similar_items_index():
+    """Index for the current catalog if it is already built, else None"""
+    if _similar_items is None:
+        return None
+    return _similar_items.current_index(catalog)
 
 # Fashion item images mapping - Using reliable placeholder images
 FASHION_IMAGES = {
@@ -87,253 +188,6 @@ def get_item_image(article_type: str) -> str:
     """Get appropriate image for fashion item type"""
     return FASHION_IMAGES.get(article_type, FASHION_IMAGES["default"])
 
-def remove_shadows_and_enhance(image):
-    """Remove shadows and enhance skin tone detection using digital image processing"""
-    # Convert to LAB color space for better shadow removal
-    lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
-    l, a, b = cv2.split(lab)
-    
-    # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization) to L channel
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    l_enhanced = clahe.apply(l)
-    
-    # Merge back and convert to RGB
-    enhanced_lab = cv2.merge([l_enhanced, a, b])
-    enhanced_rgb = cv2.cvtColor(enhanced_lab, cv2.COLOR_LAB2RGB)
-    
-    # Apply bilateral filter to reduce noise while preserving edges
-    denoised = cv2.bilateralFilter(enhanced_rgb, 9, 75, 75)
-    
-    return denoised
-
-def detect_skin_region_advanced(face_img):
-    """Advanced skin detection excluding lips, eyes, hair using multiple methods"""
-    h, w = face_img.shape[:2]
-    
-    # Method 1: YCbCr skin detection (more robust)
-    ycbcr = cv2.cvtColor(face_img, cv2.COLOR_RGB2YCrCb)
-    
-    # Enhanced skin detection ranges in YCbCr
-    lower_skin = np.array([0, 133, 77], dtype=np.uint8)
-    upper_skin = np.array([255, 173, 127], dtype=np.uint8)
-    skin_mask1 = cv2.inRange(ycbcr, lower_skin, upper_skin)
-    
-    # Method 2: HSV skin detection
-    hsv = cv2.cvtColor(face_img, cv2.COLOR_RGB2HSV)
-    lower_skin_hsv = np.array([0, 20, 70], dtype=np.uint8)
-    upper_skin_hsv = np.array([20, 255, 255], dtype=np.uint8)
-    skin_mask2 = cv2.inRange(hsv, lower_skin_hsv, upper_skin_hsv)
-    
-    # Method 3: RGB-based detection
-    r, g, b = cv2.split(face_img)
-    rgb_mask = ((r > 95) & (g > 40) & (b > 20) & 
-                ((np.maximum(r, np.maximum(g, b)) - np.minimum(r, np.minimum(g, b))) > 15) &
-                (np.abs(r.astype(int) - g.astype(int)) > 15) & 
-                (r > g) & (r > b)).astype(np.uint8) * 255
-    
-    # Combine all masks
-    combined_mask = cv2.bitwise_and(skin_mask1, skin_mask2)
-    combined_mask = cv2.bitwise_and(combined_mask, rgb_mask)
-    
-    # Exclude eye and mouth regions (approximate locations)
-    # Eyes are typically in the upper 1/3, mouth in lower 1/4
-    eye_region_mask = np.ones_like(combined_mask)
-    eye_region_mask[int(h*0.25):int(h*0.55), :] = 0  # Exclude eye region
-    
-    mouth_region_mask = np.ones_like(combined_mask)
-    mouth_region_mask[int(h*0.75):, int(w*0.25):int(w*0.75)] = 0  # Exclude mouth region
-    
-    # Apply exclusion masks
-    skin_mask_clean = cv2.bitwise_and(combined_mask, eye_region_mask)
-    skin_mask_clean = cv2.bitwise_and(skin_mask_clean, mouth_region_mask)
-    
-    # Focus on cheek areas (most reliable for skin tone)
-    cheek_mask = np.zeros_like(combined_mask)
-    # Left cheek
-    cheek_mask[int(h*0.4):int(h*0.7), int(w*0.1):int(w*0.4)] = 255
-    # Right cheek  
-    cheek_mask[int(h*0.4):int(h*0.7), int(w*0.6):int(w*0.9)] = 255
-    # Forehead center
-    cheek_mask[int(h*0.2):int(h*0.4), int(w*0.3):int(w*0.7)] = 255
-    
-    # Combine with skin detection
-    final_mask = cv2.bitwise_and(skin_mask_clean, cheek_mask)
-    
-    # Morphological operations to clean up the mask
-    kernel = np.ones((3,3), np.uint8)
-    final_mask = cv2.morphologyEx(final_mask, cv2.MORPH_OPEN, kernel)
-    final_mask = cv2.morphologyEx(final_mask, cv2.MORPH_CLOSE, kernel)
-    
-    return final_mask
-
-def analyze_skin_tone_advanced(face_img, skin_mask):
-    """Advanced skin tone analysis from masked region"""
-    # Get skin pixels only
-    skin_pixels = face_img[skin_mask > 0]
-    
-    if len(skin_pixels) < 100:
-        # Fallback to center region if mask is too small
-        h, w = face_img.shape[:2]
-        center_region = face_img[int(h*0.3):int(h*0.7), int(w*0.3):int(w*0.7)]
-        skin_pixels = center_region.reshape(-1, 3)
-    
-    # Remove outliers using IQR method
-    def remove_outliers(data):
-        q1 = np.percentile(data, 25, axis=0)
-        q3 = np.percentile(data, 75, axis=0)
-        iqr = q3 - q1
-        lower_bound = q1 - 1.5 * iqr
-        upper_bound = q3 + 1.5 * iqr
-        
-        mask = np.all((data >= lower_bound) & (data <= upper_bound), axis=1)
-        return data[mask]
-    
-    cleaned_pixels = remove_outliers(skin_pixels)
-    
-    if len(cleaned_pixels) > 50:
-        # Use median instead of mean for more robust estimation
-        median_color = np.median(cleaned_pixels, axis=0).astype(int)
-        return median_color
-    else:
-        return np.mean(skin_pixels, axis=0).astype(int)
-
-def classify_skin_tone_detailed(rgb_color):
-    """Detailed skin tone classification with undertones"""
-    r, g, b = rgb_color
-    
-    # Calculate various color metrics
-    brightness = (r + g + b) / 3
-    
-    # Undertone analysis
-    red_ratio = r / max(g + b, 1)
-    yellow_ratio = (r + g) / max(2 * b, 1)
-    
-    # Determine undertone
-    if red_ratio > 1.1:
-        undertone = "warm"
-    elif yellow_ratio > 1.2:
-        undertone = "warm"
-    elif b > max(r, g):
-        undertone = "cool"
-    else:
-        undertone = "neutral"
-    
-    # Classify depth
-    if brightness > 200:
-        depth = "Very Fair"
-        if undertone == "cool":
-            colors = ["Pastels", "White", "Lavender", "Light Blue", "Pink", "Silver"]
-        else:
-            colors = ["Cream", "Peach", "Coral", "Light Yellow", "Gold", "Warm White"]
-    elif brightness > 170:
-        depth = "Fair"
-        if undertone == "cool":
-            colors = ["Rose", "Berry", "Emerald", "Navy", "Purple", "Cool Gray"]
-        else:
-            colors = ["Warm Pink", "Coral", "Orange", "Yellow", "Camel", "Warm Brown"]
-    elif brightness > 140:
-        depth = "Light-Medium"
-        if undertone == "cool":
-            colors = ["Teal", "Sapphire", "Magenta", "Cool Red", "Black", "White"]
-        else:
-            colors = ["Rust", "Olive", "Warm Red", "Orange", "Gold", "Chocolate"]
-    elif brightness > 110:
-        depth = "Medium"
-        if undertone == "cool":
-            colors = ["Royal Blue", "Purple", "Pink", "Cool Green", "Black", "Gray"]
-        else:
-            colors = ["Burnt Orange", "Olive", "Warm Green", "Burgundy", "Gold", "Brown"]
-    elif brightness > 80:
-        depth = "Medium-Deep"
-        if undertone == "cool":
-            colors = ["Jewel Tones", "Purple", "Blue", "Pink", "Black", "White"]
-        else:
-            colors = ["Earth Tones", "Rust", "Orange", "Yellow", "Burgundy", "Camel"]
-    else:
-        depth = "Deep"
-        if undertone == "cool":
-            colors = ["Bright Colors", "Purple", "Blue", "Pink", "White", "Silver"]
-        else:
-            colors = ["Rich Colors", "Orange", "Red", "Yellow", "Gold", "Copper"]
-    
-    return f"{depth} ({undertone})", colors
-
-def detect_skin_tone_advanced(face_img):
-    """Enhanced skin tone detection using advanced digital image processing"""
-    # Remove shadows and enhance the image
-    enhanced_img = remove_shadows_and_enhance(face_img)
-    
-    # Detect skin regions while excluding non-skin areas
-    skin_mask = detect_skin_region_advanced(enhanced_img)
-    
-    # Analyze skin tone from the clean mask
-    skin_color = analyze_skin_tone_advanced(enhanced_img, skin_mask)
-    
-    return skin_color
-
-def detect_skin_tone(image_bytes: bytes) -> tuple:
-    """Enhanced skin tone detection with advanced image processing"""
-    try:
-        # Convert bytes to numpy array
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            raise HTTPException(status_code=400, detail="Invalid image format. Please use JPG, PNG, or GIF.")
-        
-        # Face detection with multiple scale factors
-        face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Apply histogram equalization for better face detection
-        gray_eq = cv2.equalizeHist(gray)
-        
-        # Try multiple detection parameters
-        faces = face_cascade.detectMultiScale(gray_eq, 1.1, 5, minSize=(50, 50), maxSize=(500, 500))
-        if len(faces) == 0:
-            faces = face_cascade.detectMultiScale(gray, 1.05, 3, minSize=(30, 30))
-        if len(faces) == 0:
-            faces = face_cascade.detectMultiScale(gray, 1.3, 4, minSize=(80, 80))
-            
-        if len(faces) == 0:
-            raise HTTPException(status_code=400, detail="No face detected. Please use a clear, well-lit photo showing your face clearly.")
-        
-        # Use the largest detected face
-        largest_face = max(faces, key=lambda f: f[2] * f[3])
-        x, y, w, h = largest_face
-        
-        # Crop face with minimal padding to focus on facial skin
-        padding_x = int(w * 0.05)  # Reduced padding
-        padding_y = int(h * 0.05)
-        x1 = max(0, x + padding_x)
-        y1 = max(0, y + padding_y)
-        x2 = min(img.shape[1], x + w - padding_x)
-        y2 = min(img.shape[0], y + h - padding_y)
-        
-        face_img = img[y1:y2, x1:x2]
-        face_rgb = cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
-        
-        # Enhanced skin tone detection
-        final_color = detect_skin_tone_advanced(face_rgb)
-        
-        # Convert to hex
-        hex_color = "#{:02x}{:02x}{:02x}".format(*final_color)
-        
-        # Detailed classification
-        skin_description, recommended_colors = classify_skin_tone_detailed(final_color)
-        
-        print(f"Advanced skin tone analysis: {skin_description}, RGB: {final_color}, Hex: {hex_color}")
-        print(f"Recommended colors: {recommended_colors}")
-        
-        return hex_color, recommended_colors
-        
-    except Exception as e:
-        print(f"Error in advanced skin tone detection: {e}")
-        if "No face detected" in str(e) or "Invalid image" in str(e):
-            raise e
-        else:
-            raise HTTPException(status_code=500, detail="Error processing image. Please try with a different photo with good lighting.")
-
 # Models
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -410,6 +264,20 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+async def user_id_from_token(token: Optional[str]) -> Optional[str]:
+    """User id from an access token, without a users lookup for current tokens"""
+    if not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        return None
+    if payload.get("uid"):
+        return payload["uid"]
+    # Tokens issued before user ids were embedded
+    user = await db.users.find_one({"email": payload.get("sub")})
+    return user["id"] if user else None
+
 # Authentication routes
 @api_router.post("/auth/signup", response_model=dict)
 async def signup(user_data: UserCreate):
@@ -433,7 +301,7 @@ async def login(user_data: UserLogin):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
+        data={"sub": user["email"], "uid": user["id"]}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -441,6 +309,19 @@ async def login(user_data: UserLogin):
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     return {"email": current_user.email, "id": current_user.id}
 
+async def run_in_skin_tone_executor(fn, *args):
+    """Run a skin tone pipeline call off the event loop, in the worker pool if configured"""
+    if skin_tone_pool is not None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(skin_tone_pool, fn, *args)
+    return await run_in_threadpool(fn, *args)
+
+async def run_skin_tone_detection(image_bytes: bytes) -> tuple:
+    try:
+        return await run_in_skin_tone_executor(skin_tone.detect_skin_tone, image_bytes)
+    except SkinToneError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
 # Skin tone and outfit recommendation routes
 @api_router.post("/analyze-skin-tone")
 async def analyze_skin_tone(
@@ -451,7 +332,7 @@ async def analyze_skin_tone(
         raise HTTPException(status_code=400, detail="File must be an image")
     
     image_bytes = await file.read()
-    detected_color, recommended_colors = detect_skin_tone(image_bytes)
+    detected_color, recommended_colors = await run_skin_tone_detection(image_bytes)
     
     # Save analysis
     analysis = SkinToneAnalysis(
@@ -459,7 +340,7 @@ async def analyze_skin_tone(
         detected_skin_tone=detected_color,
         recommended_colors=recommended_colors
     )
-    await db.skin_tone_analyses.insert_one(analysis.dict())
+    await analysis_writer.put(analysis.dict())
     
     return {
         "detected_skin_tone": detected_color,
@@ -467,50 +348,177 @@ async def analyze_skin_tone(
         "analysis_id": analysis.id
     }
 
+def recommendation_from_row(row: int) -> dict:
+    """Response dict for a catalog row, in the OutfitRecommendation shape"""
+    item = catalog.row(row)
+    recommendation = OutfitRecommendation(
+        item_id=str(item['id']),
+        product_name=item['productDisplayName'],
+        category=item['masterCategory'],
+        sub_category=item['subCategory'],
+        article_type=item['articleType'],
+        base_colour=item['baseColour'],
+        gender=item['gender'],
+        season=item['season'],
+        usage=item['usage']
+    ).dict()
+    # Add image URL to the recommendation
+    recommendation['image_url'] = get_item_image(item['articleType'])
+    return recommendation
+
+def parse_list_param(value: Optional[str]) -> List[str]:
+    """Split a comma-separated query parameter, ignoring blanks"""
+    if not value:
+        return []
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+@api_router.websocket("/analyze-skin-tone/stream")
+async def analyze_skin_tone_stream(websocket: WebSocket):
+    """Skin tone analysis over a sequence of video frames.
+    
+    The first message must be the text message {"token": <access token>}
+    ({"token": null} for an anonymous analysis); the token is not taken from
+    the URL because uvicorn logs the query string. A malformed first message
+    closes the socket with code 1008.
+    
+    The client then sends JPEG/PNG encoded frames as binary messages and
+    receives a JSON progress message per frame (or {"error": ...} for a text
+    message or a frame that cannot be decoded). As soon as the running estimate
+    converges, or after SKIN_TONE_STREAM_MAX_FRAMES messages including rejected
+    ones, a final message with "final": true is sent, the analysis is saved and
+    the socket is closed.
+    """
+    await websocket.accept()
+    state = skin_tone.StreamState()
+    result = None
+    received = 0
+    try:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        try:
+            auth = json.loads(message.get("text") or "")
+        except ValueError:
+            auth = None
+        if not isinstance(auth, dict) or not isinstance(auth.get("token"), (str, type(None))):
+            await websocket.send_json({"error": 'The first message must be {"token": <access token or null>}.'})
+            await websocket.close(code=1008)
+            return
+        user_id = await user_id_from_token(auth.get("token"))
+        
+        while received < SKIN_TONE_STREAM_MAX_FRAMES:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            # Rejected messages count too, so a client sending garbage cannot
+            # hold the socket open indefinitely
+            received += 1
+            frame = message.get("bytes")
+            if frame is None:
+                await websocket.send_json({"error": "Frames must be sent as binary messages."})
+                continue
+            try:
+                state, result = await run_in_skin_tone_executor(skin_tone.process_stream_frame, state, frame)
+            except SkinToneError as e:
+                await websocket.send_json({"error": e.detail})
+                continue
+            if result["converged"] or received >= SKIN_TONE_STREAM_MAX_FRAMES:
+                break
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        return
+    
+    if result is None or "detected_skin_tone" not in result:
+        await websocket.send_json({
+            **(result or {"frame": 0}),
+            "final": True,
+            "error": "No face detected. Please keep your face in view in good lighting."
+        })
+        await websocket.close()
+        return
+    
+    analysis = SkinToneAnalysis(
+        user_id=user_id,
+        detected_skin_tone=result["detected_skin_tone"],
+        recommended_colors=result["recommended_colors"]
+    )
+    await analysis_writer.put(analysis.dict())
+    await websocket.send_json({**result, "final": True, "analysis_id": analysis.id})
+    await websocket.close()
+
 @api_router.get("/outfit-recommendations")
 async def get_outfit_recommendations(
     gender: str,
     recommended_colors: str,  # Comma-separated colors
-    limit: int = 5
+    limit: int = 5,
+    season: Optional[str] = None,  # Comma-separated, e.g. "Summer,Spring"
+    usage: Optional[str] = None,
+    article_type: Optional[str] = None,
+    master_category: Optional[str] = None,
+    year_min: Optional[int] = None,
+    year_max: Optional[int] = None,
+    personalize: bool = False,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
 ):
-    if styles_df.empty:
+    if len(catalog) == 0:
         raise HTTPException(status_code=500, detail="Fashion dataset not available")
     
     colors_list = [color.strip() for color in recommended_colors.split(',')]
+    filters = {
+        "season": parse_list_param(season),
+        "usage": parse_list_param(usage),
+        "article_type": parse_list_param(article_type),
+        "master_category": parse_list_param(master_category),
+    }
     
-    # Filter by gender and recommended colors
-    filtered_df = styles_df[
-        (styles_df['gender'].str.lower() == gender.lower()) &
-        (styles_df['baseColour'].isin(colors_list))
-    ]
+    cache_key = make_key(gender, colors_list, {**filters, "year": (year_min, year_max)})
+    rows = candidate_cache.get(cache_key)
+    if rows is None:
+        # Filter by gender, filters and recommended colors through the bitset indexes
+        rows = catalog_index.candidate_rows(gender, colors_list, filters, year_min, year_max)
+        rows = candidate_cache.put(cache_key, rows)
+    
+    profile = None
+    if personalize:
+        user_id = await user_id_from_token(credentials.credentials if credentials else None)
+        if user_id is None:
+            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+        profile = await profile_store.get(user_id, catalog)
     
-    if filtered_df.empty:
-        # Fallback to any items for the gender
-        filtered_df = styles_df[styles_df['gender'].str.lower() == gender.lower()]
+    sample_size = min(limit, len(rows))
+    if profile is not None and not profile.is_empty():
+        # Rank candidates by the user's colour and article type preferences
+        sampled_rows = profile.rank(catalog, rows, sample_size, rng)
+    else:
+        # Sample random items
+        sampled_rows = rng.choice(rows, size=sample_size, replace=False) if sample_size > 0 else rows
     
-    # Sample random items
-    sample_size = min(limit, len(filtered_df))
-    sampled_items = filtered_df.sample(n=sample_size) if sample_size > 0 else filtered_df
-    
-    recommendations = []
-    for _, item in sampled_items.iterrows():
-        recommendation = OutfitRecommendation(
-            item_id=str(item['id']),
-            product_name=item['productDisplayName'],
-            category=item['masterCategory'],
-            sub_category=item['subCategory'],
-            article_type=item['articleType'],
-            base_colour=item['baseColour'],
-            gender=item['gender'],
-            season=item['season'],
-            usage=item['usage']
-        )
-        recommendations.append(recommendation.dict())
-        # Add image URL to the recommendation
-        recommendations[-1]['image_url'] = get_item_image(item['articleType'])
+    recommendations = [recommendation_from_row(row) for row in sampled_rows]
     
     return {"recommendations": recommendations}
 
+@api_router.get("/items/{item_id}/similar")
+async def get_similar_items(item_id: str, limit: int = 10):
+    try:
+        row = catalog.find_row(int(item_id))
+    except ValueError:
+        # Not an integer id
+        row = -1
+    if row < 0:
+        raise HTTPException(status_code=404, detail="Item not found")
+    
+    index = similar_items_index()
+    if index is None:
+        index = await run_in_threadpool(load_similar_items_index)
+    
+    rows, scores = index.similar(row, max(limit, 0))
+    similar = []
+    for similar_row, score in zip(rows, scores):
+        similar.append(recommendation_from_row(similar_row))
+        similar[-1]['similarity'] = round(float(score), 4)
+    
+    return {"item_id": item_id, "similar_items": similar}
+
 # Favorites routes
 @api_router.post("/favorites")
 async def add_to_favorites(
@@ -527,6 +535,10 @@ async def add_to_favorites(
     if existing:
         raise HTTPException(status_code=400, detail="Item already in favorites")
     
+    profile = await profile_store.get(current_user.id, catalog)
+    # Resolved before the insert so a lookup failure cannot leave a saved
+    # favorite that the profile never counted
+    colour, article_type = profile_keys_of(catalog, item_id)
     favorite = Favorite(
         user_id=current_user.id,
         item_id=item_id,
@@ -534,6 +546,7 @@ async def add_to_favorites(
         base_colour=base_colour
     )
     await db.favorites.insert_one(favorite.dict())
+    await profile_store.record(current_user.id, profile, colour, article_type, 1)
     
     return {"message": "Added to favorites"}
 
@@ -547,12 +560,15 @@ async def remove_from_favorites(
     item_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    result = await db.favorites.delete_one({
+    profile = await profile_store.get(current_user.id, catalog)
+    colour, article_type = profile_keys_of(catalog, item_id)
+    removed = await db.favorites.find_one_and_delete({
         "user_id": current_user.id,
         "item_id": item_id
     })
-    if result.deleted_count == 0:
+    if removed is None:
         raise HTTPException(status_code=404, detail="Favorite not found")
+    await profile_store.record(current_user.id, profile, colour, article_type, -1)
     
     return {"message": "Removed from favorites"}
 
@@ -561,20 +577,29 @@ async def remove_from_favorites(
 async def root():
     return {"message": "Fashion Recommendation API"}
 
+@api_router.get("/cache-stats")
+async def get_cache_stats():
+    # Each worker process has its own cache, so these are per-worker counters
+    return {"worker_pid": os.getpid(), "recommendation_candidates": candidate_cache.stats()}
+
 @api_router.get("/fashion-categories")
 async def get_fashion_categories():
-    if styles_df.empty:
+    if len(catalog) == 0:
         return {"categories": []}
     
-    categories = styles_df.groupby(['masterCategory', 'subCategory']).size().reset_index()
+    masters = catalog.tables['masterCategory']
+    subs = catalog.tables['subCategory']
+    pair_codes = catalog.codes['masterCategory'].astype(np.int64) * len(subs) + catalog.codes['subCategory']
+    pairs, counts = np.unique(pair_codes, return_counts=True)
     category_data = []
     
-    for _, row in categories.iterrows():
+    for pair, count in zip(pairs, counts):
         category_data.append({
-            "master_category": row['masterCategory'],
-            "sub_category": row['subCategory'],
-            "count": row[0]
+            "master_category": masters[pair // len(subs)],
+            "sub_category": subs[pair % len(subs)],
+            "count": int(count)
         })
+    category_data.sort(key=lambda c: (c["master_category"], c["sub_category"]))
     
     return {"categories": category_data}
 
@@ -589,13 +614,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+async def warm_up_skin_tone():
+    with startup_phase("skin_tone_warmup"):
+        try:
+            await run_in_threadpool(skin_tone.warm_up)
+        except Exception as e:
+            logger.warning(f"Skin tone warm-up failed, will load on first use: {e}")
+
+@app.on_event("startup")
+async def start_skin_tone_pipeline():
+    global skin_tone_pool
+    if SKIN_TONE_WORKERS > 0:
+        # spawn, not fork: workers must not inherit the event loop or Mongo client
+        skin_tone_pool = ProcessPoolExecutor(
+            max_workers=SKIN_TONE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=skin_tone.init_worker,
+        )
+        logger.info(f"Skin tone analysis runs in a pool of {SKIN_TONE_WORKERS} worker processes")
+    elif SKIN_TONE_WARMUP:
+        asyncio.create_task(warm_up_skin_tone())
+    logger.info(f"Startup timings (ms): {startup_timings}")
+
+@app.on_event("shutdown")
+async def shutdown_skin_tone_pool():
+    if skin_tone_pool is not None:
+        skin_tone_pool.shutdown(wait=False, cancel_futures=True)
+
+async def warm_up_similar_items():
+    with startup_phase("similar_items_warmup"):
+        try:
+            await run_in_threadpool(load_similar_items_index)
+        except Exception as e:
+            logger.warning(f"Similar items warm-up failed, will build on first use: {e}")
+
+@app.on_event("startup")
+async def start_similar_items_index():
+    if SIMILAR_ITEMS_WARMUP and len(catalog) > 0:
+        asyncio.create_task(warm_up_similar_items())
+
+@app.on_event("startup")
+async def start_analysis_writer():
+    analysis_writer.start()
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    try:
+        await analysis_writer.close()
+    finally:
+        client.close()
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""Lightweight entry points for skin tone analysis.
+
+Importing this module is cheap: the OpenCV pipeline in ``skin_tone_cv`` is only
+loaded on first use, by the warm-up task, or inside a dedicated worker process.
+The functions here are module-level so they can be submitted to a process pool.
+"""
+import importlib
+import logging
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class SkinToneError(Exception):
+    """Raised when an image cannot be analyzed; carries the HTTP status to report."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+    def __str__(self):
+        return self.detail
+
+
+_pipeline = None
+
+def load_pipeline():
+    """Import the OpenCV pipeline on first use"""
+    global _pipeline
+    if _pipeline is None:
+        started = time.perf_counter()
+        _pipeline = importlib.import_module("skin_tone_cv")
+        logger.info(f"Loaded skin tone pipeline in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return _pipeline
+
+def warm_up() -> bool:
+    """Load OpenCV and the face cascade ahead of the first request"""
+    return load_pipeline().warm_up()
+
+def init_worker():
+    """Process pool initializer: each worker loads the pipeline once at startup"""
+    warm_up()
+
+def detect_skin_tone(image_bytes: bytes) -> tuple:
+    """Detect the skin tone in an image; returns (hex color, recommended colors)"""
+    return load_pipeline().detect_skin_tone(image_bytes)
+
+
+# Multi-frame (video) analysis. A StreamState carries everything the pipeline
+# needs between frames, and is small and picklable so that each frame can be
+# processed in a thread or in the worker pool alike.
+STREAM_MIN_FRAMES = 8
+STREAM_MAX_SAMPLES = 90
+# Converged once the standard error of the median skin colour is below this
+# many RGB units on every channel (the depth classes are 30 units apart)
+STREAM_CONVERGED_STDERR = 4.0
+
+
+class StreamState:
+    def __init__(self):
+        self.frames = 0
+        # Face box (x, y, w, h) in full-frame pixels, and the grayscale
+        # template used to track it between detections
+        self.box: Optional[Tuple[int, int, int, int]] = None
+        self.template: Optional[np.ndarray] = None
+        self.samples: List[Tuple[int, int, int]] = []
+
+    def add_sample(self, rgb):
+        self.samples.append(tuple(int(c) for c in rgb))
+        del self.samples[:-STREAM_MAX_SAMPLES]
+
+    def aggregate(self) -> Tuple[Optional[np.ndarray], float]:
+        """Median skin colour over recent frames and its standard error.
+
+        The spread is estimated from the median absolute deviation so that
+        frames with a bad exposure or a mis-tracked box do not dominate it.
+        """
+        if not self.samples:
+            return None, float("inf")
+        samples = np.array(self.samples, dtype=np.float64)
+        median = np.median(samples, axis=0)
+        sigma = 1.4826 * np.median(np.abs(samples - median), axis=0)
+        stderr = float(np.max(1.2533 * sigma / np.sqrt(len(samples))))
+        return median.round().astype(int), stderr
+
+    def converged(self) -> bool:
+        _, stderr = self.aggregate()
+        return len(self.samples) >= STREAM_MIN_FRAMES and stderr <= STREAM_CONVERGED_STDERR
+
+    def confidence(self) -> float:
+        _, stderr = self.aggregate()
+        if not self.samples:
+            return 0.0
+        coverage = min(1.0, len(self.samples) / STREAM_MIN_FRAMES)
+        precision = min(1.0, STREAM_CONVERGED_STDERR / max(stderr, 1e-9))
+        return round(coverage * precision, 3)
+
+def process_stream_frame(state: StreamState, frame_bytes: bytes) -> Tuple[StreamState, dict]:
+    """Feed one encoded video frame; returns the updated state and running result"""
+    return load_pipeline().process_stream_frame(state, frame_bytes)
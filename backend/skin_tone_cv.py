@@ -0,0 +1,355 @@
+"""OpenCV skin tone detection pipeline.
+
+Only imported through ``skin_tone.load_pipeline()`` so that API processes which
+never analyze images do not pay for loading OpenCV.
+"""
+import threading
+
+import cv2
+import numpy as np
+
+from skin_tone import SkinToneError
+
+# CascadeClassifier is not safe to share between threads, so each thread
+# (requests run in the threadpool) keeps its own instance.
+_local = threading.local()
+
+def get_face_cascade():
+    """Load the Haar face cascade once per thread"""
+    cascade = getattr(_local, "face_cascade", None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        _local.face_cascade = cascade
+    return cascade
+
+def warm_up():
+    """Load OpenCV and the face cascade ahead of the first request"""
+    get_face_cascade()
+    return True
+
+def remove_shadows_and_enhance(image):
+    """Remove shadows and enhance skin tone detection using digital image processing"""
+    # Convert to LAB color space for better shadow removal
+    lab = cv2.cvtColor(image, cv2.COLOR_RGB2LAB)
+    l, a, b = cv2.split(lab)
+    
+    # Apply CLAHE (Contrast Limited Adaptive Histogram Equalization) to L channel
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    l_enhanced = clahe.apply(l)
+    
+    # Merge back and convert to RGB
+    enhanced_lab = cv2.merge([l_enhanced, a, b])
+    enhanced_rgb = cv2.cvtColor(enhanced_lab, cv2.COLOR_LAB2RGB)
+    
+    # Apply bilateral filter to reduce noise while preserving edges
+    denoised = cv2.bilateralFilter(enhanced_rgb, 9, 75, 75)
+    
+    return denoised
+
+def detect_skin_region_advanced(face_img):
+    """Advanced skin detection excluding lips, eyes, hair using multiple methods"""
+    h, w = face_img.shape[:2]
+    
+    # Method 1: YCbCr skin detection (more robust)
+    ycbcr = cv2.cvtColor(face_img, cv2.COLOR_RGB2YCrCb)
+    
+    # Enhanced skin detection ranges in YCbCr
+    lower_skin = np.array([0, 133, 77], dtype=np.uint8)
+    upper_skin = np.array([255, 173, 127], dtype=np.uint8)
+    skin_mask1 = cv2.inRange(ycbcr, lower_skin, upper_skin)
+    
+    # Method 2: HSV skin detection
+    hsv = cv2.cvtColor(face_img, cv2.COLOR_RGB2HSV)
+    lower_skin_hsv = np.array([0, 20, 70], dtype=np.uint8)
+    upper_skin_hsv = np.array([20, 255, 255], dtype=np.uint8)
+    skin_mask2 = cv2.inRange(hsv, lower_skin_hsv, upper_skin_hsv)
+    
+    # Method 3: RGB-based detection
+    r, g, b = cv2.split(face_img)
+    rgb_mask = ((r > 95) & (g > 40) & (b > 20) & 
+                ((np.maximum(r, np.maximum(g, b)) - np.minimum(r, np.minimum(g, b))) > 15) &
+                (np.abs(r.astype(int) - g.astype(int)) > 15) & 
+                (r > g) & (r > b)).astype(np.uint8) * 255
+    
+    # Combine all masks
+    combined_mask = cv2.bitwise_and(skin_mask1, skin_mask2)
+    combined_mask = cv2.bitwise_and(combined_mask, rgb_mask)
+    
+    # Exclude eye and mouth regions (approximate locations)
+    # Eyes are typically in the upper 1/3, mouth in lower 1/4
+    eye_region_mask = np.ones_like(combined_mask)
+    eye_region_mask[int(h*0.25):int(h*0.55), :] = 0  # Exclude eye region
+    
+    mouth_region_mask = np.ones_like(combined_mask)
+    mouth_region_mask[int(h*0.75):, int(w*0.25):int(w*0.75)] = 0  # Exclude mouth region
+    
+    # Apply exclusion masks
+    skin_mask_clean = cv2.bitwise_and(combined_mask, eye_region_mask)
+    skin_mask_clean = cv2.bitwise_and(skin_mask_clean, mouth_region_mask)
+    
+    # Focus on cheek areas (most reliable for skin tone)
+    cheek_mask = np.zeros_like(combined_mask)
+    # Left cheek
+    cheek_mask[int(h*0.4):int(h*0.7), int(w*0.1):int(w*0.4)] = 255
+    # Right cheek  
+    cheek_mask[int(h*0.4):int(h*0.7), int(w*0.6):int(w*0.9)] = 255
+    # Forehead center
+    cheek_mask[int(h*0.2):int(h*0.4), int(w*0.3):int(w*0.7)] = 255
+    
+    # Combine with skin detection
+    final_mask = cv2.bitwise_and(skin_mask_clean, cheek_mask)
+    
+    # Morphological operations to clean up the mask
+    kernel = np.ones((3,3), np.uint8)
+    final_mask = cv2.morphologyEx(final_mask, cv2.MORPH_OPEN, kernel)
+    final_mask = cv2.morphologyEx(final_mask, cv2.MORPH_CLOSE, kernel)
+    
+    return final_mask
+
+def analyze_skin_tone_advanced(face_img, skin_mask):
+    """Advanced skin tone analysis from masked region"""
+    # Get skin pixels only
+    skin_pixels = face_img[skin_mask > 0]
+    
+    if len(skin_pixels) < 100:
+        # Fallback to center region if mask is too small
+        h, w = face_img.shape[:2]
+        center_region = face_img[int(h*0.3):int(h*0.7), int(w*0.3):int(w*0.7)]
+        skin_pixels = center_region.reshape(-1, 3)
+    
+    # Remove outliers using IQR method
+    def remove_outliers(data):
+        q1 = np.percentile(data, 25, axis=0)
+        q3 = np.percentile(data, 75, axis=0)
+        iqr = q3 - q1
+        lower_bound = q1 - 1.5 * iqr
+        upper_bound = q3 + 1.5 * iqr
+        
+        mask = np.all((data >= lower_bound) & (data <= upper_bound), axis=1)
+        return data[mask]
+    
+    cleaned_pixels = remove_outliers(skin_pixels)
+    
+    if len(cleaned_pixels) > 50:
+        # Use median instead of mean for more robust estimation
+        median_color = np.median(cleaned_pixels, axis=0).astype(int)
+        return median_color
+    else:
+        return np.mean(skin_pixels, axis=0).astype(int)
+
+def classify_skin_tone_detailed(rgb_color):
+    """Detailed skin tone classification with undertones"""
+    r, g, b = rgb_color
+    
+    # Calculate various color metrics
+    brightness = (r + g + b) / 3
+    
+    # Undertone analysis
+    red_ratio = r / max(g + b, 1)
+    yellow_ratio = (r + g) / max(2 * b, 1)
+    
+    # Determine undertone
+    if red_ratio > 1.1:
+        undertone = "warm"
+    elif yellow_ratio > 1.2:
+        undertone = "warm"
+    elif b > max(r, g):
+        undertone = "cool"
+    else:
+        undertone = "neutral"
+    
+    # Classify depth
+    if brightness > 200:
+        depth = "Very Fair"
+        if undertone == "cool":
+            colors = ["Pastels", "White", "Lavender", "Light Blue", "Pink", "Silver"]
+        else:
+            colors = ["Cream", "Peach", "Coral", "Light Yellow", "Gold", "Warm White"]
+    elif brightness > 170:
+        depth = "Fair"
+        if undertone == "cool":
+            colors = ["Rose", "Berry", "Emerald", "Navy", "Purple", "Cool Gray"]
+        else:
+            colors = ["Warm Pink", "Coral", "Orange", "Yellow", "Camel", "Warm Brown"]
+    elif brightness > 140:
+        depth = "Light-Medium"
+        if undertone == "cool":
+            colors = ["Teal", "Sapphire", "Magenta", "Cool Red", "Black", "White"]
+        else:
+            colors = ["Rust", "Olive", "Warm Red", "Orange", "Gold", "Chocolate"]
+    elif brightness > 110:
+        depth = "Medium"
+        if undertone == "cool":
+            colors = ["Royal Blue", "Purple", "Pink", "Cool Green", "Black", "Gray"]
+        else:
+            colors = ["Burnt Orange", "Olive", "Warm Green", "Burgundy", "Gold", "Brown"]
+    elif brightness > 80:
+        depth = "Medium-Deep"
+        if undertone == "cool":
+            colors = ["Jewel Tones", "Purple", "Blue", "Pink", "Black", "White"]
+        else:
+            colors = ["Earth Tones", "Rust", "Orange", "Yellow", "Burgundy", "Camel"]
+    else:
+        depth = "Deep"
+        if undertone == "cool":
+            colors = ["Bright Colors", "Purple", "Blue", "Pink", "White", "Silver"]
+        else:
+            colors = ["Rich Colors", "Orange", "Red", "Yellow", "Gold", "Copper"]
+    
+    return f"{depth} ({undertone})", colors
+
+def detect_skin_tone_advanced(face_img):
+    """Enhanced skin tone detection using advanced digital image processing"""
+    # Remove shadows and enhance the image
+    enhanced_img = remove_shadows_and_enhance(face_img)
+    
+    # Detect skin regions while excluding non-skin areas
+    skin_mask = detect_skin_region_advanced(enhanced_img)
+    
+    # Analyze skin tone from the clean mask
+    skin_color = analyze_skin_tone_advanced(enhanced_img, skin_mask)
+    
+    return skin_color
+
+def crop_face_rgb(img, box):
+    """Crop a face box from a BGR image as RGB, trimming the edges"""
+    x, y, w, h = box
+    
+    # Crop face with minimal padding to focus on facial skin
+    padding_x = int(w * 0.05)  # Reduced padding
+    padding_y = int(h * 0.05)
+    x1 = max(0, x + padding_x)
+    y1 = max(0, y + padding_y)
+    x2 = min(img.shape[1], x + w - padding_x)
+    y2 = min(img.shape[0], y + h - padding_y)
+    
+    face_img = img[y1:y2, x1:x2]
+    return cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB)
+
+def detect_skin_tone(image_bytes: bytes) -> tuple:
+    """Enhanced skin tone detection with advanced image processing"""
+    try:
+        # Convert bytes to numpy array
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        
+        if img is None:
+            raise SkinToneError(400, "Invalid image format. Please use JPG, PNG, or GIF.")
+        
+        # Face detection with multiple scale factors
+        face_cascade = get_face_cascade()
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        
+        # Apply histogram equalization for better face detection
+        gray_eq = cv2.equalizeHist(gray)
+        
+        # Try multiple detection parameters
+        faces = face_cascade.detectMultiScale(gray_eq, 1.1, 5, minSize=(50, 50), maxSize=(500, 500))
+        if len(faces) == 0:
+            faces = face_cascade.detectMultiScale(gray, 1.05, 3, minSize=(30, 30))
+        if len(faces) == 0:
+            faces = face_cascade.detectMultiScale(gray, 1.3, 4, minSize=(80, 80))
+            
+        if len(faces) == 0:
+            raise SkinToneError(400, "No face detected. Please use a clear, well-lit photo showing your face clearly.")
+        
+        # Use the largest detected face
+        largest_face = max(faces, key=lambda f: f[2] * f[3])
+        face_rgb = crop_face_rgb(img, largest_face)
+        
+        # Enhanced skin tone detection
+        final_color = detect_skin_tone_advanced(face_rgb)
+        
+        # Convert to hex
+        hex_color = "#{:02x}{:02x}{:02x}".format(*final_color)
+        
+        # Detailed classification
+        skin_description, recommended_colors = classify_skin_tone_detailed(final_color)
+        
+        print(f"Advanced skin tone analysis: {skin_description}, RGB: {final_color}, Hex: {hex_color}")
+        print(f"Recommended colors: {recommended_colors}")
+        
+        return hex_color, recommended_colors
+        
+    except Exception as e:
+        print(f"Error in advanced skin tone detection: {e}")
+        if isinstance(e, SkinToneError):
+            raise e
+        else:
+            raise SkinToneError(500, "Error processing image. Please try with a different photo with good lighting.")
+
+# Streaming analysis: run the cascade only every few frames on a downscaled
+# frame, follow the face with template matching in between, and analyze a
+# face crop capped at 256 px (smaller crops bias the skin mask), so each frame
+# stays well within a 15 fps budget on CPU.
+STREAM_DETECT_EVERY = 5
+STREAM_DETECT_SIZE = 320
+STREAM_FACE_SIZE = 256
+STREAM_TEMPLATE_SIZE = 48
+STREAM_TRACK_MIN_SCORE = 0.6
+
+def detect_face_fast(gray):
+    """Largest face in a grayscale frame, searched at STREAM_DETECT_SIZE"""
+    scale = min(1.0, STREAM_DETECT_SIZE / max(gray.shape))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+    faces = get_face_cascade().detectMultiScale(cv2.equalizeHist(small), 1.1, 5, minSize=(30, 30))
+    if len(faces) == 0:
+        return None
+    x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+    return tuple(int(round(v / scale)) for v in (x, y, w, h))
+
+def face_template(gray, box):
+    x, y, w, h = box
+    return cv2.resize(gray[y:y + h, x:x + w], (STREAM_TEMPLATE_SIZE, STREAM_TEMPLATE_SIZE), interpolation=cv2.INTER_AREA)
+
+def track_face(gray, box, template):
+    """Follow a face box into a new frame by matching its template nearby"""
+    x, y, w, h = box
+    scale = STREAM_TEMPLATE_SIZE / w
+    # Search a window one half box larger on every side, at template scale
+    x1, y1 = max(0, x - w // 2), max(0, y - h // 2)
+    x2, y2 = min(gray.shape[1], x + w + w // 2), min(gray.shape[0], y + h + h // 2)
+    window = cv2.resize(gray[y1:y2, x1:x2], None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    if window.shape[0] < template.shape[0] or window.shape[1] < template.shape[1]:
+        return None
+    scores = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+    _, best, _, (dx, dy) = cv2.minMaxLoc(scores)
+    if best < STREAM_TRACK_MIN_SCORE:
+        return None
+    return (x1 + int(round(dx / scale)), y1 + int(round(dy / scale)), w, h)
+
+def process_stream_frame(state, frame_bytes: bytes):
+    """Analyze one frame of a stream and fold it into the running aggregate"""
+    img = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise SkinToneError(400, "Invalid frame format. Please send JPEG or PNG encoded frames.")
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    
+    box = None
+    if state.box is not None and state.frames % STREAM_DETECT_EVERY != 0:
+        box = track_face(gray, state.box, state.template)
+    if box is None:
+        box = detect_face_fast(gray)
+        state.template = face_template(gray, box) if box is not None else None
+    state.box = box
+    state.frames += 1
+    
+    if box is not None:
+        face_rgb = crop_face_rgb(img, box)
+        scale = min(1.0, STREAM_FACE_SIZE / max(face_rgb.shape[:2]))
+        if scale < 1.0:
+            face_rgb = cv2.resize(face_rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        state.add_sample(detect_skin_tone_advanced(face_rgb))
+    
+    color, _ = state.aggregate()
+    result = {
+        "frame": state.frames,
+        "face_detected": box is not None,
+        "samples": len(state.samples),
+        "confidence": state.confidence(),
+        "converged": state.converged(),
+    }
+    if color is not None:
+        result["detected_skin_tone"] = "#{:02x}{:02x}{:02x}".format(*color)
+        result["skin_description"], result["recommended_colors"] = classify_skin_tone_detailed(color)
+    return state, result
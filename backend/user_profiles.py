@@ -0,0 +1,164 @@
+"""Per-user preference profiles built from favorites.
+
+A profile counts how often each baseColour and articleType appears in a user's
+favorites. It is kept in ``db.user_profiles`` and updated with ``$inc`` as
+favorites are added or removed, so it is never recomputed from the favorites
+collection (except once, to backfill users who had favorites before profiles
+existed). ``ProfileStore`` keeps recently used profiles in memory so the
+recommendation hot path does not need a Mongo round trip.
+
+Ranking treats the profile as a weight vector over colour and article type
+codes; each candidate's score is the dot product of its one-hot (colour, type)
+features with that vector, which reduces to two gathers over the code arrays.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from catalog import Catalog
+
+# Ties between equally scored items are broken randomly so that results still
+# vary between requests; this is far smaller than one favorite's weight.
+_JITTER = 1e-3
+
+
+def _field(name: str) -> str:
+    # Mongo field names may not contain '.' or start with '$'
+    return name.replace(".", "_").lstrip("$")
+
+
+class UserProfile:
+    def __init__(self, colours: Optional[Dict[str, int]] = None, article_types: Optional[Dict[str, int]] = None):
+        self.colours = dict(colours or {})
+        self.article_types = dict(article_types or {})
+
+    @classmethod
+    def from_document(cls, document: Optional[dict]) -> "UserProfile":
+        if not document:
+            return cls()
+        return cls(document.get("colours"), document.get("article_types"))
+
+    def is_empty(self) -> bool:
+        return not any(count > 0 for count in self.colours.values()) and \
+            not any(count > 0 for count in self.article_types.values())
+
+    def apply(self, colour: Optional[str], article_type: Optional[str], delta: int):
+        """Add (delta=1) or remove (delta=-1) one favorite"""
+        for counts, name in ((self.colours, colour), (self.article_types, article_type)):
+            if name:
+                key = _field(name)
+                counts[key] = counts.get(key, 0) + delta
+                if counts[key] <= 0:
+                    del counts[key]
+
+    def _weights(self, catalog: Catalog, column: str, counts: Dict[str, int]) -> np.ndarray:
+        table = catalog.tables[column]
+        weights = np.zeros(len(table), dtype=np.float32)
+        total = sum(count for count in counts.values() if count > 0)
+        if total:
+            for name, count in counts.items():
+                code = table.code(name)
+                if code >= 0 and count > 0:
+                    weights[code] = count / total
+        return weights
+
+    def scores(self, catalog: Catalog, rows: np.ndarray) -> np.ndarray:
+        colour_weights = self._weights(catalog, "baseColour", self.colours)
+        type_weights = self._weights(catalog, "articleType", self.article_types)
+        return colour_weights[catalog.codes["baseColour"][rows]] + type_weights[catalog.codes["articleType"][rows]]
+
+    def rank(self, catalog: Catalog, rows: np.ndarray, limit: int, rng: np.random.Generator) -> np.ndarray:
+        """The limit best-scoring candidate rows, best first"""
+        limit = min(limit, len(rows))
+        if limit <= 0:
+            return rows[:0]
+        scores = self.scores(catalog, rows) + rng.random(len(rows), dtype=np.float32) * _JITTER
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        return rows[top[np.argsort(-scores[top])]]
+
+
+class ProfileStore:
+    """Mongo-backed user profiles with an in-process LRU cache.
+
+    Cached entries expire after ``ttl`` seconds so that updates made by other
+    worker processes are picked up; updates made by this process are applied
+    to the cached copy immediately.
+    """
+
+    def __init__(self, db, max_entries: int = 10000, ttl: float = 300.0):
+        self.db = db
+        self.collection = db.user_profiles
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[UserProfile, float]]" = OrderedDict()
+
+    def _cached(self, user_id: str) -> Optional[UserProfile]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl:
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry[0]
+
+    def _remember(self, user_id: str, profile: UserProfile):
+        self._entries[user_id] = (profile, time.monotonic())
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get(self, user_id: str, catalog: Catalog) -> UserProfile:
+        profile = self._cached(user_id)
+        if profile is not None:
+            return profile
+        document = await self.collection.find_one({"user_id": user_id})
+        if document is None:
+            document = await self._backfill(user_id, catalog)
+        profile = UserProfile.from_document(document)
+        self._remember(user_id, profile)
+        return profile
+
+    async def _backfill(self, user_id: str, catalog: Catalog) -> dict:
+        """One-off profile build for users whose favorites predate profiles"""
+        profile = UserProfile()
+        async for favorite in self.db.favorites.find({"user_id": user_id}):
+            profile.apply(*profile_keys_of(catalog, favorite.get("item_id")), 1)
+        document = {"user_id": user_id, "colours": profile.colours, "article_types": profile.article_types}
+        await self.collection.update_one({"user_id": user_id}, {"$setOnInsert": document}, upsert=True)
+        return document
+
+    async def record(self, user_id: str, profile: UserProfile, colour: Optional[str], article_type: Optional[str], delta: int):
+        """Apply one favorite change to the stored profile and its cached copy.
+
+        ``profile`` must come from ``get`` before the favorite was changed, so
+        a backfill never already includes the change being recorded.
+        """
+        increments = {}
+        if colour:
+            increments[f"colours.{_field(colour)}"] = delta
+        if article_type:
+            increments[f"article_types.{_field(article_type)}"] = delta
+        if increments:
+            await self.collection.update_one({"user_id": user_id}, {"$inc": increments}, upsert=True)
+        profile.apply(colour, article_type, delta)
+        self._remember(user_id, profile)
+
+
+def profile_keys_of(catalog: Catalog, item_id: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """(baseColour, articleType) of a catalog item id, or (None, None) for unknown items.
+
+    Both come from the catalog rather than from the client, so a profile only
+    ever counts values that exist in the catalog.
+    """
+    if not item_id:
+        return None, None
+    try:
+        row = catalog.find_row(int(item_id))
+    except (TypeError, ValueError):
+        return None, None
+    if row < 0:
+        return None, None
+    return catalog.value("baseColour", row), catalog.value("articleType", row)
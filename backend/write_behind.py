@@ -0,0 +1,134 @@
+"""Write-behind buffer for documents nobody reads back on the request path.
+
+Request handlers ``put`` documents into a bounded queue and return without a
+Mongo round trip; a background task drains the queue and writes batches with
+``insert_many`` once ``max_batch`` documents are waiting or ``flush_interval``
+seconds have passed. Transient errors are retried with backoff, and ``close``
+flushes whatever is still queued at shutdown.
+"""
+import asyncio
+import logging
+from typing import List, Optional
+
+from pymongo.errors import BulkWriteError, ConnectionFailure, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+DUPLICATE_KEY = 11000
+
+
+def is_transient(error: Exception) -> bool:
+    """Network failures and errors the server labels as retryable"""
+    if isinstance(error, ConnectionFailure):
+        return True
+    return isinstance(error, OperationFailure) and error.has_error_label("RetryableWriteError")
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        collection,
+        max_batch: int = 100,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        max_retries: int = 5,
+        retry_backoff: float = 0.5,
+    ):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        # Batch taken off the queue but not yet confirmed written
+        self._pending: List[dict] = []
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def put(self, document: dict):
+        """Queue a document; only waits when the queue is full (backpressure)"""
+        if self._task is None or self._task.done():
+            # Not running (startup not reached, or already closed): write through
+            await self.collection.insert_one(document)
+            return
+        await self._queue.put(document)
+
+    async def close(self):
+        """Flush every queued document and stop the background task.
+
+        If the task has failed or been cancelled, whatever it did not write is
+        flushed directly, so queued documents are not lost at shutdown.
+        """
+        task, self._task = self._task, None
+        if task is None:
+            return
+        if not task.done():
+            await self._queue.put(_STOP)
+            # wait() does not re-raise the task's exception or cancellation
+            await asyncio.wait({task})
+        if task.cancelled():
+            logger.warning(f"Write-behind task for {self.collection.name} was cancelled, flushing directly")
+        elif task.exception() is not None:
+            logger.error(f"Write-behind task for {self.collection.name} failed, flushing directly: {task.exception()}")
+        await self._drain()
+
+    async def _drain(self):
+        documents, self._pending = self._pending, []
+        while not self._queue.empty():
+            document = self._queue.get_nowait()
+            if document is not _STOP:
+                documents.append(document)
+        for start in range(0, len(documents), self.max_batch):
+            await self._flush(documents[start:start + self.max_batch])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            # Held here as well as in batch so close() can still write it
+            # if the task is cancelled while collecting
+            self._pending = batch
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    document = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if document is _STOP:
+                    stopping = True
+                    break
+                batch.append(document)
+            await self._flush(batch)
+            self._pending = []
+
+    async def _flush(self, batch: List[dict]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                # insert_many sets _id on each document, so a retry after a
+                # partial write only hits duplicate-key errors for rows that landed
+                await self.collection.insert_many(batch, ordered=False)
+                return
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if all(error.get("code") == DUPLICATE_KEY for error in errors):
+                    return
+                logger.error(f"Dropping {len(errors)} of {len(batch)} documents for {self.collection.name}: {errors[:1]}")
+                return
+            except Exception as e:
+                if not is_transient(e) or attempt == self.max_retries:
+                    logger.error(f"Dropping {len(batch)} documents for {self.collection.name}: {e}")
+                    return
+                delay = self.retry_backoff * 2 ** attempt
+                logger.warning(f"Transient error writing to {self.collection.name}, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
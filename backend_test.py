@@ -49,6 +49,30 @@ class FashionRecommendationAPITest(unittest.TestCase):
             return {"Authorization": f"Bearer {self.token}"}
         return {}
     
+    def create_test_face_jpeg(self):
+        """JPEG bytes of a simple face-like test image"""
+        # Create a simple test image (a solid color face-like shape)
+        img = Image.new('RGB', (300, 300), color=(245, 210, 180))  # Light skin tone color
+        
+        # Draw a simple face-like shape to help face detection
+        from PIL import ImageDraw
+        draw = ImageDraw.Draw(img)
+        # Draw a circle for the face
+        draw.ellipse((50, 50, 250, 250), fill=(245, 210, 180))
+        # Draw eyes
+        draw.ellipse((100, 120, 130, 150), fill=(255, 255, 255))
+        draw.ellipse((170, 120, 200, 150), fill=(255, 255, 255))
+        # Draw pupils
+        draw.ellipse((110, 130, 120, 140), fill=(0, 0, 0))
+        draw.ellipse((180, 130, 190, 140), fill=(0, 0, 0))
+        # Draw mouth
+        draw.arc((120, 150, 180, 200), start=0, end=180, fill=(150, 75, 75), width=5)
+        
+        # Save to BytesIO
+        img_byte_arr = BytesIO()
+        img.save(img_byte_arr, format='JPEG')
+        return img_byte_arr.getvalue()
+    
     def test_01_root_endpoint(self):
         """Test the root API endpoint"""
         print("\n🔍 Testing root API endpoint...")
@@ -121,6 +145,85 @@ class FashionRecommendationAPITest(unittest.TestCase):
         except Exception as e:
             self.fail(f"❌ Outfit recommendations endpoint test failed: {str(e)}")
     
+    def test_04a_outfit_recommendation_filters(self):
+        """Test the season/usage/article type/category/year filters"""
+        print("\n🔍 Testing outfit recommendation filters...")
+        try:
+            params = {
+                "gender": "Men",
+                "recommended_colors": "Blue,Black,White",
+                "limit": 20,
+                "season": "Summer,Fall",
+                "usage": "Casual",
+                "master_category": "Apparel",
+                "year_min": 2010,
+                "year_max": 2016
+            }
+            response = requests.get(f"{API_URL}/outfit-recommendations", params=params)
+            self.assertEqual(response.status_code, 200)
+            recommendations = response.json()["recommendations"]
+            for item in recommendations:
+                self.assertIn(item["season"], ["Summer", "Fall"])
+                self.assertEqual(item["usage"], "Casual")
+                self.assertEqual(item["category"], "Apparel")
+            print(f"✅ Got {len(recommendations)} filtered recommendations")
+        except Exception as e:
+            self.fail(f"❌ Outfit recommendation filters test failed: {str(e)}")
+    
+    def test_04b_recommendation_cache_stats(self):
+        """Test that repeated recommendation queries are served from the cache"""
+        print("\n🔍 Testing recommendation cache stats endpoint...")
+        try:
+            params = {
+                "gender": "Men",
+                "recommended_colors": "Blue,Black",
+                "limit": 3
+            }
+            requests.get(f"{API_URL}/outfit-recommendations", params=params)
+            response = requests.get(f"{API_URL}/cache-stats")
+            self.assertEqual(response.status_code, 200)
+            before = response.json()
+            
+            # Same query with colours reordered and gender in another case
+            params["recommended_colors"] = "Black,Blue"
+            params["gender"] = "men"
+            response = requests.get(f"{API_URL}/outfit-recommendations", params=params)
+            self.assertEqual(response.status_code, 200)
+            response = requests.get(f"{API_URL}/cache-stats")
+            after = response.json()
+            stats = after["recommendation_candidates"]
+            self.assertIn("hit_rate", stats)
+            
+            # Stats are per worker process; with several workers the requests
+            # may have landed on different ones, so only compare within one
+            if after["worker_pid"] == before["worker_pid"]:
+                self.assertGreater(stats["hits"], before["recommendation_candidates"]["hits"])
+            print(f"✅ Recommendation cache hit rate (worker {after['worker_pid']}): {stats['hit_rate']}")
+        except Exception as e:
+            self.fail(f"❌ Recommendation cache stats test failed: {str(e)}")
+    
+    def test_04c_similar_items(self):
+        """Test the similar items endpoint"""
+        print("\n🔍 Testing similar items endpoint...")
+        try:
+            params = {"gender": "Men", "recommended_colors": "Blue", "limit": 1}
+            response = requests.get(f"{API_URL}/outfit-recommendations", params=params)
+            item_id = response.json()["recommendations"][0]["item_id"]
+            
+            response = requests.get(f"{API_URL}/items/{item_id}/similar", params={"limit": 5})
+            self.assertEqual(response.status_code, 200)
+            similar = response.json()["similar_items"]
+            self.assertLessEqual(len(similar), 5)
+            self.assertNotIn(item_id, [item["item_id"] for item in similar])
+            scores = [item["similarity"] for item in similar]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            print(f"✅ Got {len(similar)} items similar to {item_id}")
+            
+            response = requests.get(f"{API_URL}/items/not-an-item/similar")
+            self.assertEqual(response.status_code, 404)
+        except Exception as e:
+            self.fail(f"❌ Similar items test failed: {str(e)}")
+    
     def test_05_favorites_crud(self):
         """Test the favorites CRUD operations"""
         print("\n🔍 Testing favorites CRUD operations...")
@@ -183,32 +286,56 @@ class FashionRecommendationAPITest(unittest.TestCase):
         except Exception as e:
             self.fail(f"❌ Favorites CRUD test failed: {str(e)}")
     
+    def test_05b_personalized_recommendations(self):
+        """Test recommendations re-ranked by the user's favorites"""
+        print("\n🔍 Testing personalized recommendations...")
+        if not self.token:
+            self.skipTest("No authentication token available")
+        
+        try:
+            params = {
+                "gender": "Men",
+                "recommended_colors": "Blue,Black,White,Grey",
+                "limit": 3,
+                "personalize": "true"
+            }
+            # Personalization requires a signed-in user
+            response = requests.get(f"{API_URL}/outfit-recommendations", params=params)
+            self.assertEqual(response.status_code, 401)
+            
+            # Favorite a catalog item, then its colour should rank first
+            response = requests.get(
+                f"{API_URL}/outfit-recommendations",
+                params={"gender": "Men", "recommended_colors": "Black", "limit": 1}
+            )
+            item = response.json()["recommendations"][0]
+            favorite = {
+                "item_id": item["item_id"],
+                "product_name": item["product_name"],
+                "base_colour": item["base_colour"]
+            }
+            requests.post(f"{API_URL}/favorites", params=favorite, headers=self.get_auth_headers())
+            try:
+                response = requests.get(
+                    f"{API_URL}/outfit-recommendations",
+                    params=params,
+                    headers=self.get_auth_headers()
+                )
+                self.assertEqual(response.status_code, 200)
+                recommendations = response.json()["recommendations"]
+                self.assertEqual(recommendations[0]["base_colour"], item["base_colour"])
+                print(f"✅ Personalized recommendations ranked {item['base_colour']} first")
+            finally:
+                requests.delete(f"{API_URL}/favorites/{item['item_id']}", headers=self.get_auth_headers())
+        except Exception as e:
+            self.fail(f"❌ Personalized recommendations test failed: {str(e)}")
+    
     def test_06_skin_tone_analysis(self):
         """Test the skin tone analysis endpoint with a test image"""
         print("\n🔍 Testing skin tone analysis endpoint...")
         
         try:
-            # Create a simple test image (a solid color face-like shape)
-            img = Image.new('RGB', (300, 300), color=(245, 210, 180))  # Light skin tone color
-            
-            # Draw a simple face-like shape to help face detection
-            from PIL import ImageDraw
-            draw = ImageDraw.Draw(img)
-            # Draw a circle for the face
-            draw.ellipse((50, 50, 250, 250), fill=(245, 210, 180))
-            # Draw eyes
-            draw.ellipse((100, 120, 130, 150), fill=(255, 255, 255))
-            draw.ellipse((170, 120, 200, 150), fill=(255, 255, 255))
-            # Draw pupils
-            draw.ellipse((110, 130, 120, 140), fill=(0, 0, 0))
-            draw.ellipse((180, 130, 190, 140), fill=(0, 0, 0))
-            # Draw mouth
-            draw.arc((120, 150, 180, 200), start=0, end=180, fill=(150, 75, 75), width=5)
-            
-            # Save to BytesIO
-            img_byte_arr = BytesIO()
-            img.save(img_byte_arr, format='JPEG')
-            img_byte_arr.seek(0)
+            img_byte_arr = BytesIO(self.create_test_face_jpeg())
             
             # Prepare the file for upload
             files = {'file': ('test_face.jpg', img_byte_arr, 'image/jpeg')}
@@ -238,6 +365,52 @@ class FashionRecommendationAPITest(unittest.TestCase):
         except Exception as e:
             print(f"⚠️ Skin tone analysis test exception: {str(e)}")
             print("   Note: This test may fail due to face detection or image processing requirements")
+    
+    def test_07_skin_tone_stream(self):
+        """Test the streaming skin tone analysis WebSocket with repeated frames"""
+        print("\n🔍 Testing skin tone analysis stream...")
+        
+        try:
+            from websockets.sync.client import connect
+            
+            url = f"{BACKEND_URL.replace('http', 'ws', 1)}/api/analyze-skin-tone/stream"
+            frame = self.create_test_face_jpeg()
+            
+            with connect(url) as websocket:
+                # The token goes in the first message, never in the URL
+                websocket.send(json.dumps({"token": self.token}))
+                
+                # Text messages are rejected without closing the stream
+                websocket.send("not a frame")
+                message = json.loads(websocket.recv(timeout=10))
+                self.assertIn("error", message)
+                
+                progress = []
+                final = None
+                # The server caps the stream, so this always ends with a final message
+                for _ in range(500):
+                    websocket.send(frame)
+                    message = json.loads(websocket.recv(timeout=30))
+                    if message.get("final"):
+                        final = message
+                        break
+                    self.assertIn("frame", message)
+                    self.assertIn("face_detected", message)
+                    progress.append(message)
+            
+            self.assertIsNotNone(final)
+            self.assertIn("frame", final)
+            print(f"✅ Stream finished after {len(progress) + 1} frames")
+            if "detected_skin_tone" in final:
+                self.assertIn("analysis_id", final)
+                print(f"   Detected skin tone: {final['detected_skin_tone']} (confidence {final.get('confidence')})")
+            else:
+                # Same face detection limitation as test_06
+                print(f"⚠️ No face detected in the stream: {final.get('error')}")
+                print("   Note: This may happen with the synthetic test image")
+        
+        except Exception as e:
+            self.fail(f"Skin tone stream test failed: {str(e)}")
 
 if __name__ == "__main__":
     unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,149 @@
+import asyncio
+import itertools
+import sys
+import unittest
+from pathlib import Path
+
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+from write_behind import DUPLICATE_KEY, WriteBehindBuffer
+
+
+class FakeCollection:
+    """In-memory stand-in for a Motor collection with scripted failures.
+
+    ``failures`` is consumed one entry per ``insert_many`` call: None writes
+    the batch, an exception is raised without writing anything, and
+    ``("partial", n, exception)`` writes the first n documents and then raises.
+    Like Mongo, documents are keyed by ``_id`` and a repeated ``_id`` is a
+    duplicate key error for that document only (unordered inserts).
+    """
+
+    name = "fake"
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.documents = {}
+        self.calls = []
+        self.block = None
+        self._ids = itertools.count()
+
+    async def insert_one(self, document):
+        await self.insert_many([document])
+
+    async def insert_many(self, documents, ordered=True):
+        for document in documents:
+            document.setdefault("_id", next(self._ids))
+        self.calls.append([document["n"] for document in documents])
+        if self.block is not None:
+            await self.block.wait()
+        failure = self.failures.pop(0) if self.failures else None
+        if isinstance(failure, Exception):
+            raise failure
+        if failure is not None:
+            _, written, error = failure
+            self._write(documents[:written])
+            raise error
+        self._write(documents)
+
+    def _write(self, documents):
+        duplicates = [
+            {"index": i, "code": DUPLICATE_KEY, "errmsg": "duplicate key"}
+            for i, document in enumerate(documents)
+            if document["_id"] in self.documents
+        ]
+        for document in documents:
+            self.documents.setdefault(document["_id"], dict(document))
+        if duplicates:
+            raise BulkWriteError({"writeErrors": duplicates})
+
+    def written(self):
+        return sorted(document["n"] for document in self.documents.values())
+
+
+class WriteBehindBufferTest(unittest.IsolatedAsyncioTestCase):
+    """Batching, retry and shutdown behaviour of WriteBehindBuffer"""
+
+    async def put_all(self, buffer, count):
+        for n in range(count):
+            await buffer.put({"n": n})
+
+    async def test_flushes_full_batches_without_waiting(self):
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_batch=3, flush_interval=60)
+        buffer.start()
+        await self.put_all(buffer, 7)
+        await asyncio.sleep(0.05)
+        self.assertEqual(collection.calls, [[0, 1, 2], [3, 4, 5]])
+        await buffer.close()
+        self.assertEqual(collection.calls[-1], [6])
+        self.assertEqual(collection.written(), list(range(7)))
+
+    async def test_flushes_partial_batch_after_interval(self):
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_batch=100, flush_interval=0.05)
+        buffer.start()
+        await self.put_all(buffer, 2)
+        await asyncio.sleep(0.2)
+        self.assertEqual(collection.calls, [[0, 1]])
+        await buffer.close()
+        self.assertEqual(collection.written(), [0, 1])
+
+    async def test_retries_transient_errors(self):
+        collection = FakeCollection(failures=[ConnectionFailure("connection reset")])
+        buffer = WriteBehindBuffer(collection, max_batch=3, flush_interval=60, retry_backoff=0.01)
+        buffer.start()
+        await self.put_all(buffer, 3)
+        with self.assertLogs("write_behind", "WARNING"):
+            await buffer.close()
+        self.assertEqual(collection.calls, [[0, 1, 2], [0, 1, 2]])
+        self.assertEqual(collection.written(), [0, 1, 2])
+
+    async def test_duplicates_after_partial_write_count_as_written(self):
+        # The first attempt lands two documents before the connection drops;
+        # the retry re-sends them with the same _id and only those collide
+        collection = FakeCollection(failures=[("partial", 2, ConnectionFailure("connection reset"))])
+        buffer = WriteBehindBuffer(collection, max_batch=4, flush_interval=60, retry_backoff=0.01)
+        buffer.start()
+        await self.put_all(buffer, 4)
+        with self.assertNoLogs("write_behind", "ERROR"):
+            await buffer.close()
+        self.assertEqual(len(collection.calls), 2)
+        self.assertEqual(collection.written(), [0, 1, 2, 3])
+
+    async def test_drops_batch_on_permanent_error(self):
+        collection = FakeCollection(failures=[BulkWriteError({"writeErrors": [{"index": 0, "code": 121}]})])
+        buffer = WriteBehindBuffer(collection, max_batch=2, flush_interval=60, retry_backoff=0.01)
+        buffer.start()
+        await self.put_all(buffer, 3)
+        with self.assertLogs("write_behind", "ERROR"):
+            await buffer.close()
+        self.assertEqual(len(collection.calls), 2)
+        self.assertEqual(collection.written(), [2])
+
+    async def test_close_flushes_pending_and_queued_after_cancel(self):
+        collection = FakeCollection()
+        collection.block = asyncio.Event()
+        buffer = WriteBehindBuffer(collection, max_batch=2, flush_interval=60)
+        buffer.start()
+        await self.put_all(buffer, 5)
+        await asyncio.sleep(0.05)
+        # The task is stuck writing [0, 1] with 2-4 still queued
+        self.assertEqual(collection.calls, [[0, 1]])
+        buffer._task.cancel()
+        collection.block.set()
+        with self.assertLogs("write_behind", "WARNING"):
+            await buffer.close()
+        self.assertEqual(collection.written(), [0, 1, 2, 3, 4])
+
+    async def test_put_writes_through_when_not_started(self):
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection)
+        await buffer.put({"n": 0})
+        self.assertEqual(collection.written(), [0])
+
+
+if __name__ == "__main__":
+    unittest.main()